@@ -1,97 +1,374 @@
-import json
+import atexit
+import csv
+import glob
 import os
+import queue
 import random
+import shutil
+import subprocess
+import sqlite3
 import schedule
 import time
 import logging
-from datetime import datetime, timedelta
-import pytz
-from instaloader import Instaloader, Post
-from instagrapi import Client
-import pandas as pd
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Set up logging; records go through a queue so download threads never
+# contend on the stream handler's lock
+log_queue = queue.Queue()
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+log_listener = QueueListener(log_queue, log_handler)
+# The queue handler only renders the message; log_handler adds the prefix
+logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[QueueHandler(log_queue)])
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
+# description.csv is an append-only event log: one DOWNLOAD row per reel and
+# one UPLOAD row per upload, folded into description.xlsx by export_excel()
+DESCRIPTION_CSV_FIELDS = ['Event', 'URL', 'Description', 'Timestamp']
+DESCRIPTION_EXCEL_FIELDS = ['URL', 'Description', 'Download_Date', 'Upload_Date']
+
+JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# Re-encode downloads to 720x1280 H.264 before upload
+TRANSCODE_ARGS = [
+    '-vf', 'scale=720:1280:force_original_aspect_ratio=decrease,pad=720:1280:(ow-iw)/2:(oh-ih)/2',
+    '-c:v', 'libx264', '-b:v', '3M', '-preset', 'veryfast',
+    '-c:a', 'aac', '-b:a', '128k'
+]
+TRANSCODE_TIMEOUT = 600
+TRANSCODE_ERROR_CHARS = 500
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday')
+WEEKEND = ('saturday', 'sunday')
+WEEKDAY_TIMES = ("07:30", "11:00", "13:30", "17:30", "21:00")
+WEEKEND_TIMES = ("09:00", "12:00", "15:00", "18:30", "21:30")
+UPLOAD_SCHEDULE = ((WEEKDAYS, WEEKDAY_TIMES), (WEEKEND, WEEKEND_TIMES))
+
 class InstagramReelBot:
     def __init__(self):
         self.download_dir = "downloaded_reels"
-        self.reels_file = "reels.json"
+        self.reels_file = "reels.jsonl"
+        self.legacy_reels_file = "reels.json"
         self.used_file = "used.json"
         self.description_file = "description.xlsx"
+        self.description_csv = "description.csv"
+        self.session_file = "ig_session.json"
+        self.queue_file = "queue.db"
         self.daily_limit = 5
+        self.ffmpeg = shutil.which("ffmpeg")
+        if not self.ffmpeg:
+            logger.warning("ffmpeg not found on PATH, reels will be uploaded without transcoding")
         
         # Create directories
         os.makedirs(self.download_dir, exist_ok=True)
         
         # Initialize Instagram clients
-        self.loader = Instaloader(
-            download_pictures=False,
-            download_video_thumbnails=False,
-            download_comments=False,
-            save_metadata=False,
-            post_metadata_txt_pattern=""
+        self._local = threading.local()
+        self._description_lock = threading.Lock()
+        self._transcode_lock = threading.Lock()
+        
+        # Keep-alive connection pools: CDN downloads retry rate limits and
+        # server errors with backoff, while the per-thread Instaloader sessions
+        # share a pool without retries so Instaloader's own rate controller
+        # still sees every 429
+        self._http_adapter = HTTPAdapter(
+            pool_connections=10, pool_maxsize=10,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=RETRY_STATUSES)
         )
+        self._loader_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=0)
+        self._http = self.mount_http_adapter(requests.Session(), self._http_adapter)
         
-        self.client = Client()
         self.setup_instagram_login()
         
         # Initialize files
+        self._today = None
+        self._queue = sqlite3.connect(self.queue_file)
         self.initialize_files()
+        
+        # Keep used reels in memory and write them through to disk; the
+        # reels file itself is streamed when sampling
+        self._used = dict.fromkeys(self.load_json_file(self.used_file))
+        self._used_dirty = False
+        self._batch_depth = 0
+        
+        # Description rows indexed by URL, folded from the description log
+        self._descriptions = self.load_descriptions()
+        # The workbook is stale if the log changed after the last export,
+        # e.g. when the bot was stopped without reaching its final export
+        self._descriptions_dirty = (
+            not os.path.exists(self.description_file)
+            or os.path.getmtime(self.description_csv) > os.path.getmtime(self.description_file)
+        )
+    
+    @property
+    def loader(self):
+        """Per-thread Instaloader, since its context is not thread-safe"""
+        loader = getattr(self._local, 'loader', None)
+        if loader is None:
+            from instaloader import Instaloader
+            loader = self._local.loader = Instaloader(
+                download_pictures=False,
+                download_video_thumbnails=False,
+                download_comments=False,
+                save_metadata=False,
+                post_metadata_txt_pattern=""
+            )
+            self.mount_http_adapter(loader.context._session, self._loader_adapter)
+        return loader
+    
+    def mount_http_adapter(self, session, adapter):
+        """Route a requests session through a shared connection pool"""
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
     
     def setup_instagram_login(self):
         """Setup Instagram login credentials"""
+        # instagrapi is heavy, so it is only imported when logging in
+        from instagrapi import Client
+        from instagrapi.exceptions import LoginRequired
+        
+        self.client = Client()
+        # Keep instagrapi's own retry policy on the account session, with a
+        # larger keep-alive pool
+        private_adapter = self.client.private.get_adapter('https://')
+        pooled_adapter = HTTPAdapter(
+            pool_connections=10, pool_maxsize=10, max_retries=private_adapter.max_retries
+        )
+        self.client.private.mount('https://', pooled_adapter)
+        self.client.private.mount('http://', pooled_adapter)
         try:
             # Use environment variables if available, otherwise fallback to hardcoded values
             username = os.getenv('INSTAGRAM_USERNAME', 'antxlust')
             password = os.getenv('INSTAGRAM_PASSWORD', 'Roopa@143')
             
-            self.client.login(username, password)
-            logger.info(f"Successfully logged into Instagram with username: {username}")
+            # Reuse a saved session and only log in again if it has expired
+            if os.path.exists(self.session_file):
+                self.client.load_settings(self.session_file)
+                try:
+                    self.client.get_timeline_feed()
+                except LoginRequired:
+                    # login() is a no-op while the stale session is loaded, so
+                    # clear it but keep the device UUIDs
+                    logger.info("Saved Instagram session expired, logging in again")
+                    old_settings = self.client.get_settings()
+                    self.client.set_settings({})
+                    self.client.set_uuids(old_settings["uuids"])
+                    self.client.login(username, password)
+            else:
+                self.client.login(username, password)
+            self.save_session()
+            logger.info("Successfully logged into Instagram with username: %s", username)
         except Exception as e:
-            logger.error(f"Failed to login to Instagram: {e}")
+            logger.error("Failed to login to Instagram: %s", e)
             raise
     
+    def save_session(self):
+        """Save the Instagram session, readable only by the current user"""
+        # Create the file as 0600 before writing so cookies are never world-readable
+        os.close(os.open(self.session_file, os.O_WRONLY | os.O_CREAT, 0o600))
+        os.chmod(self.session_file, 0o600)
+        self.client.dump_settings(self.session_file)
+    
     def initialize_files(self):
-        """Initialize JSON and Excel files if they don't exist"""
+        """Initialize JSON, CSV and queue files if they don't exist"""
+        # Dedupe reels.jsonl and merge in URLs added to a legacy reels.json
+        self.prepare_reels_file()
+        
         # Initialize used.json
         if not os.path.exists(self.used_file):
-            with open(self.used_file, 'w') as f:
-                json.dump([], f)
+            self.save_json_file(self.used_file, [])
         
-        # Initialize description.xlsx
-        if not os.path.exists(self.description_file):
-            df = pd.DataFrame(columns=['URL', 'Description', 'Download_Date', 'Upload_Date'])
-            df.to_excel(self.description_file, index=False)
+        # Initialize description.csv, seeding it from an existing description.xlsx
+        if not os.path.exists(self.description_csv):
+            rows = []
+            if os.path.exists(self.description_file):
+                import pandas as pd
+                df = pd.read_excel(self.description_file, dtype=str).fillna('')
+                for record in df.to_dict('records'):
+                    rows.append(['DOWNLOAD', record['URL'], record['Description'], record['Download_Date']])
+                    if record['Upload_Date']:
+                        rows.append(['UPLOAD', record['URL'], '', record['Upload_Date']])
+            with open(self.description_csv, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(DESCRIPTION_CSV_FIELDS)
+                writer.writerows(rows)
+        
+        # Initialize the upload queue
+        with self._queue:
+            self._queue.execute(
+                "CREATE TABLE IF NOT EXISTS queue ("
+                "id INTEGER PRIMARY KEY, day TEXT NOT NULL, path TEXT NOT NULL, "
+                "description TEXT NOT NULL, url TEXT NOT NULL, uploaded_at TEXT)"
+            )
+            self._queue.execute("CREATE INDEX IF NOT EXISTS queue_day ON queue (day, uploaded_at)")
+        self.import_legacy_daily_reels()
+    
+    def import_legacy_daily_reels(self):
+        """Move reels still pending in old daily_reels_<date>.json files into the queue"""
+        today_file = f"daily_reels_{self.today}.json"
+        for daily_reels_file in sorted(glob.glob("daily_reels_*.json")):
+            if daily_reels_file != today_file:
+                logger.warning("Ignoring leftover %s from an earlier day", daily_reels_file)
+                continue
+            daily_reels = self.load_json_file(daily_reels_file)
+            with self._queue:
+                self._queue.executemany(
+                    "INSERT INTO queue (day, path, description, url) VALUES (?, ?, ?, ?)",
+                    [(self.today, r['file_path'], r['description'], r['url']) for r in daily_reels]
+                )
+            # Rename rather than delete so the import only ever happens once
+            os.replace(daily_reels_file, daily_reels_file + '.imported')
+            logger.info("Imported %d pending reels from %s", len(daily_reels), daily_reels_file)
+    
+    def prepare_reels_file(self):
+        """Dedupe reels.jsonl and append reels from the legacy reels.json it lacks"""
+        # Compare decoded URLs so spacing or escaping differences still match;
+        # malformed lines are kept as-is and reported when sampling
+        known = set()
+        lines = []
+        duplicates = 0
+        missing_newline = False
+        if os.path.exists(self.reels_file):
+            with open(self.reels_file, 'rb') as f:
+                for line in f:
+                    missing_newline = not line.endswith(b'\n')
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        reel = orjson.loads(line)
+                        if reel in known:
+                            duplicates += 1
+                            continue
+                        known.add(reel)
+                    except (orjson.JSONDecodeError, TypeError):
+                        pass
+                    lines.append(line + b'\n')
+        
+        new_lines = []
+        if os.path.exists(self.legacy_reels_file):
+            for reel in self.load_json_file(self.legacy_reels_file):
+                if reel not in known:
+                    known.add(reel)
+                    new_lines.append(orjson.dumps(reel) + b'\n')
+        
+        if duplicates:
+            # Sampling relies on unique lines, so rewrite the file deduplicated
+            tmp_file = self.reels_file + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                f.writelines(lines)
+                f.writelines(new_lines)
+            os.replace(tmp_file, self.reels_file)
+            logger.info("Removed %d duplicate reels from %s", duplicates, self.reels_file)
+        elif new_lines:
+            with open(self.reels_file, 'ab') as f:
+                # A hand-edited file may lack a trailing newline
+                if missing_newline:
+                    f.write(b'\n')
+                f.writelines(new_lines)
+        if new_lines:
+            logger.info("Merged %d new reels from %s into %s",
+                        len(new_lines), self.legacy_reels_file, self.reels_file)
     
     def load_json_file(self, filename):
         """Load data from JSON file"""
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(filename, 'rb') as f:
+                return orjson.loads(f.read())
         except FileNotFoundError:
             return []
-        except json.JSONDecodeError:
-            logger.error(f"Error reading {filename}")
+        except orjson.JSONDecodeError:
+            logger.error("Error reading %s", filename)
             return []
     
     def save_json_file(self, filename, data):
-        """Save data to JSON file"""
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-    
-    def get_available_reels(self):
-        """Get reels that haven't been used yet"""
-        all_reels = self.load_json_file(self.reels_file)
-        used_reels = self.load_json_file(self.used_file)
-        
-        available_reels = [reel for reel in all_reels if reel not in used_reels]
-        return available_reels
+        """Atomically save data to JSON file"""
+        tmp_file = filename + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(orjson.dumps(data, option=JSON_OPTIONS))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, filename)
+    
+    def mark_used(self, urls):
+        """Mark reels as used, persisting unless inside batch_writes()"""
+        for url in urls:
+            self._used[url] = None
+        self._used_dirty = True
+        if not self._batch_depth:
+            self.flush_used()
+    
+    def flush_used(self):
+        """Atomically write the used reels to disk if they changed"""
+        if not self._used_dirty:
+            return
+        self.save_json_file(self.used_file, list(self._used))
+        self._used_dirty = False
+    
+    @contextmanager
+    def batch_writes(self):
+        """Defer used.json writes until the outermost batch exits"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush_used()
+    
+    def iter_available_reels(self):
+        """Stream reels that haven't been used yet from the JSONL reels file"""
+        try:
+            with open(self.reels_file, 'rb') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        reel = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        logger.error("Skipping malformed line in %s: %r", self.reels_file, line)
+                        continue
+                    if reel not in self._used:
+                        yield reel
+        except FileNotFoundError:
+            return
+    
+    def sample_available_reels(self, k):
+        """Reservoir-sample k unused reels, returning them with the available count"""
+        # reels.jsonl holds unique URLs (see prepare_reels_file), so only the
+        # reservoir itself is kept in memory
+        reservoir = []
+        count = 0
+        for reel in self.iter_available_reels():
+            count += 1
+            if len(reservoir) < k:
+                reservoir.append(reel)
+            else:
+                slot = random.randrange(count)
+                if slot < k:
+                    reservoir[slot] = reel
+        random.shuffle(reservoir)
+        return reservoir, count
     
     def extract_reel_info(self, url):
         """Extract reel information including description"""
         try:
+            from instaloader import Post
             shortcode = url.rstrip('/').split('/')[-1]
             post = Post.from_shortcode(self.loader.context, shortcode)
             
@@ -100,37 +377,63 @@ class InstagramReelBot:
                 'url': url,
                 'description': description,
                 'shortcode': shortcode,
-                'is_video': post.is_video
+                'is_video': post.is_video,
+                'video_url': post.video_url
             }
         except Exception as e:
-            logger.error(f"Failed to extract info from {url}: {e}")
+            logger.error("Failed to extract info from %s: %s", url, e)
             return None
     
-    def download_reel(self, url):
-        """Download a single reel"""
+    def extract_reel_infos(self, urls):
+        """Extract reel information for several URLs in one media/infos request"""
+        from instagrapi.extractors import extract_media_v1
+        
         try:
-            reel_info = self.extract_reel_info(url)
+            shortcodes = {url: url.rstrip('/').split('/')[-1] for url in urls}
+            urls_by_pk = {str(self.client.media_pk_from_code(code)): url for url, code in shortcodes.items()}
+            result = self.client.private_request(
+                "media/infos/", params={"media_ids": ",".join(urls_by_pk)}
+            )
+            
+            reel_infos = {}
+            for item in result.get('items', []):
+                media = extract_media_v1(item)
+                url = urls_by_pk.get(str(media.pk))
+                if url is None:
+                    continue
+                reel_infos[url] = {
+                    'url': url,
+                    'description': media.caption_text or "No description available",
+                    'shortcode': shortcodes[url],
+                    'is_video': media.media_type == 2,
+                    'video_url': str(media.video_url) if media.video_url else None
+                }
+            return reel_infos
+        except Exception as e:
+            logger.error("Failed to batch extract reel info, falling back to per-reel lookups: %s", e)
+            return {}
+    
+    def download_reel(self, url, reel_info=None):
+        """Download a single reel, fetching its info unless already known"""
+        try:
+            if reel_info is None:
+                reel_info = self.extract_reel_info(url)
             if not reel_info or not reel_info['is_video']:
-                logger.warning(f"Skipping {url} - not a video")
+                logger.warning("Skipping %s - not a video", url)
                 return None
             
             shortcode = reel_info['shortcode']
-            post = Post.from_shortcode(self.loader.context, shortcode)
             
-            # Download the reel
-            self.loader.download_post(post, target=self.download_dir)
+            # Download only the video
+            video_file = os.path.join(self.download_dir, f"{shortcode}.mp4")
+            size = self.download_video(reel_info['video_url'], video_file)
+            if self.transcode_video(video_file):
+                size = os.path.getsize(video_file)
             
-            # Find the downloaded video file
-            video_file = None
-            for file in os.listdir(self.download_dir):
-                if shortcode in file and file.endswith('.mp4'):
-                    video_file = os.path.join(self.download_dir, file)
-                    break
-            
-            if video_file:
+            if os.path.exists(video_file):
                 # Save description to Excel
                 self.save_description_to_excel(reel_info)
-                logger.info(f"Successfully downloaded: {url}")
+                logger.info("Successfully downloaded: url=%s path=%s bytes=%d", url, video_file, size)
                 return {
                     'file_path': video_file,
                     'description': reel_info['description'],
@@ -138,160 +441,222 @@ class InstagramReelBot:
                 }
             
         except Exception as e:
-            logger.error(f"Failed to download {url}: {e}")
+            logger.error("Failed to download %s: %s", url, e)
             return None
     
-    def save_description_to_excel(self, reel_info):
-        """Save reel description to Excel file"""
-        try:
-            df = pd.read_excel(self.description_file)
-            new_row = {
-                'URL': reel_info['url'],
-                'Description': reel_info['description'],
-                'Download_Date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    def apply_description_event(self, descriptions, event, url, description, timestamp):
+        """Fold a single description log event into the URL index"""
+        if event == 'DOWNLOAD':
+            descriptions[url] = {
+                'URL': url,
+                'Description': description,
+                'Download_Date': timestamp,
                 'Upload_Date': ''
             }
-            df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-            df.to_excel(self.description_file, index=False)
+        elif event == 'UPLOAD' and url in descriptions:
+            descriptions[url]['Upload_Date'] = timestamp
+    
+    def load_descriptions(self):
+        """Load the description log into a URL index"""
+        descriptions = {}
+        with open(self.description_csv, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                self.apply_description_event(
+                    descriptions, row['Event'], row['URL'], row['Description'], row['Timestamp']
+                )
+        return descriptions
+    
+    def append_description_event(self, event, url, description=''):
+        """Append a single event row to the description log"""
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        with self._description_lock:
+            with open(self.description_csv, 'a', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow([event, url, description, timestamp])
+            self.apply_description_event(self._descriptions, event, url, description, timestamp)
+            self._descriptions_dirty = True
+    
+    def download_video(self, video_url, video_file):
+        """Stream a video to disk, replacing the target only once complete"""
+        tmp_file = video_file + '.part'
+        size = 0
+        try:
+            with self._http.get(video_url, stream=True, timeout=30) as response:
+                response.raise_for_status()
+                with open(tmp_file, 'wb', buffering=DOWNLOAD_CHUNK_SIZE) as f:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        size += f.write(chunk)
+            os.replace(tmp_file, video_file)
+        except BaseException:
+            # Don't leave partial downloads behind in the download directory
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        return size
+    
+    def transcode_video(self, video_file):
+        """Transcode a video in place to a reel-friendly bitrate, if ffmpeg is available"""
+        if not self.ffmpeg:
+            return False
+        tmp_file = video_file + '.transcode.mp4'
+        try:
+            # Each libx264 encode already uses every core, so run one at a time;
+            # -nostdin stops a backgrounded ffmpeg from blocking on the terminal
+            with self._transcode_lock:
+                subprocess.run(
+                    [self.ffmpeg, '-nostdin', '-y', '-loglevel', 'error', '-i', video_file,
+                     *TRANSCODE_ARGS, tmp_file],
+                    check=True, capture_output=True, stdin=subprocess.DEVNULL,
+                    timeout=TRANSCODE_TIMEOUT
+                )
+            os.replace(tmp_file, video_file)
+            return True
+        except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            # CalledProcessError's message omits ffmpeg's own error output
+            if isinstance(e, subprocess.CalledProcessError) and e.stderr:
+                error = e.stderr.decode('utf-8', errors='replace').strip()[-TRANSCODE_ERROR_CHARS:]
+            else:
+                error = e
+            logger.warning("Failed to transcode %s, uploading original: %s", video_file, error)
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            return False
+    
+    def save_description_to_excel(self, reel_info):
+        """Save reel description to the description log"""
+        try:
+            self.append_description_event('DOWNLOAD', reel_info['url'], reel_info['description'])
         except Exception as e:
-            logger.error(f"Failed to save description to Excel: {e}")
+            logger.error("Failed to save description: %s", e)
     
     def update_upload_date_in_excel(self, url):
-        """Update upload date in Excel file"""
+        """Record the upload date in the description log"""
+        try:
+            self.append_description_event('UPLOAD', url)
+        except Exception as e:
+            logger.error("Failed to update upload date: %s", e)
+    
+    def export_excel(self):
+        """Write the in-memory description index to description.xlsx"""
         try:
-            df = pd.read_excel(self.description_file)
-            df.loc[df['URL'] == url, 'Upload_Date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            # Build the DataFrame once per export, and only if rows changed
+            with self._description_lock:
+                if not self._descriptions_dirty:
+                    return
+                rows = [dict(row) for row in self._descriptions.values()]
+                self._descriptions_dirty = False
+            import pandas as pd
+            df = pd.DataFrame(rows, columns=DESCRIPTION_EXCEL_FIELDS)
             df.to_excel(self.description_file, index=False)
         except Exception as e:
-            logger.error(f"Failed to update upload date: {e}")
+            self._descriptions_dirty = True
+            logger.error("Failed to export descriptions to Excel: %s", e)
     
     def upload_reel(self, video_path, description, url):
         """Upload reel to Instagram"""
         try:
             self.client.clip_upload(video_path, description)
             self.update_upload_date_in_excel(url)
-            logger.info(f"Successfully uploaded reel: {video_path}")
-            
-            # Delete the video file after upload
-            if os.path.exists(video_path):
-                os.remove(video_path)
-                logger.info(f"Deleted video file: {video_path}")
-            
+            logger.info("Successfully uploaded reel: url=%s path=%s", url, video_path)
             return True
         except Exception as e:
-            logger.error(f"Failed to upload {video_path}: {e}")
+            logger.error("Failed to upload %s: %s", video_path, e)
             return False
     
     def process_daily_reels(self):
         """Download and prepare 5 reels for the day"""
-        available_reels = self.get_available_reels()
+        # Select 5 random reels
+        selected_reels, available = self.sample_available_reels(self.daily_limit)
         
-        if len(available_reels) < self.daily_limit:
-            logger.warning(f"Not enough reels available. Found: {len(available_reels)}")
+        if available < self.daily_limit:
+            logger.warning("Not enough reels available. Found: %s", available)
             return []
         
-        # Select 5 random reels
-        selected_reels = random.sample(available_reels, self.daily_limit)
+        # Fetch metadata for all selected reels in a single request
+        reel_infos = self.extract_reel_infos(selected_reels)
         downloaded_reels = []
         
-        for url in selected_reels:
-            reel_data = self.download_reel(url)
-            if reel_data:
-                downloaded_reels.append(reel_data)
+        # Downloads are network-bound, so run them concurrently
+        with ThreadPoolExecutor(max_workers=min(5, self.daily_limit)) as executor:
+            futures = [
+                executor.submit(self.download_reel, url, reel_infos.get(url))
+                for url in selected_reels
+            ]
+            for future in as_completed(futures):
+                reel_data = future.result()
+                if reel_data:
+                    downloaded_reels.append(reel_data)
         
         # Mark reels as used
-        used_reels = self.load_json_file(self.used_file)
-        used_reels.extend(selected_reels)
-        self.save_json_file(self.used_file, used_reels)
+        self.mark_used(selected_reels)
         
-        # Store today's reels for upload
-        today = datetime.now().strftime('%Y-%m-%d')
-        daily_reels_file = f"daily_reels_{today}.json"
-        self.save_json_file(daily_reels_file, downloaded_reels)
+        # Queue today's reels for upload
+        with self._queue:
+            self._queue.executemany(
+                "INSERT INTO queue (day, path, description, url) VALUES (?, ?, ?, ?)",
+                [(self.today, r['file_path'], r['description'], r['url']) for r in downloaded_reels]
+            )
+        self.export_excel()
         
-        logger.info(f"Prepared {len(downloaded_reels)} reels for today")
+        logger.info("Prepared %s reels for today", len(downloaded_reels))
         return downloaded_reels
     
+    @property
+    def today(self):
+        """Today's date, cached until the midnight rollover"""
+        if self._today is None:
+            self._today = time.strftime('%Y-%m-%d')
+        return self._today
+    
+    def rollover_day(self):
+        """Forget the cached date at midnight"""
+        self._today = None
+    
+    def has_daily_reels(self):
+        """Check whether reels have been queued for today"""
+        row = self._queue.execute("SELECT 1 FROM queue WHERE day = ? LIMIT 1", (self.today,)).fetchone()
+        return row is not None
+    
     def upload_next_reel(self):
         """Upload the next scheduled reel"""
-        today = datetime.now().strftime('%Y-%m-%d')
-        daily_reels_file = f"daily_reels_{today}.json"
-        
-        if not os.path.exists(daily_reels_file):
+        if not self.has_daily_reels():
             logger.info("No reels prepared for today")
             return
         
-        daily_reels = self.load_json_file(daily_reels_file)
+        # Get the next reel to upload
+        row = self._queue.execute(
+            "SELECT id, path, description, url FROM queue "
+            "WHERE day = ? AND uploaded_at IS NULL ORDER BY id LIMIT 1",
+            (self.today,)
+        ).fetchone()
         
-        if not daily_reels:
+        if not row:
             logger.info("All reels for today have been uploaded")
             return
         
-        # Get the next reel to upload
-        reel_data = daily_reels.pop(0)
-        
-        # Upload the reel
-        success = self.upload_reel(
-            reel_data['file_path'],
-            reel_data['description'],
-            reel_data['url']
-        )
-        
-        if success:
-            # Update the daily reels file
-            self.save_json_file(daily_reels_file, daily_reels)
-        else:
-            # Put the reel back if upload failed
-            daily_reels.insert(0, reel_data)
-            self.save_json_file(daily_reels_file, daily_reels)
+        # Upload the reel; a failed upload stays at the head of the queue
+        reel_id, video_path, description, url = row
+        if self.upload_reel(video_path, description, url):
+            with self._queue:
+                self._queue.execute(
+                    "UPDATE queue SET uploaded_at = ? WHERE id = ?",
+                    (time.strftime('%Y-%m-%d %H:%M:%S'), reel_id)
+                )
+            
+            # Delete the video only once the upload is recorded, so a crash
+            # never leaves a pending row without its file
+            if os.path.exists(video_path):
+                os.remove(video_path)
     
     def setup_schedule(self):
         """Setup the upload schedule"""
-        # Weekday schedule (Monday to Friday)
-        schedule.every().monday.at("07:30").do(self.upload_next_reel)
-        schedule.every().monday.at("11:00").do(self.upload_next_reel)
-        schedule.every().monday.at("13:30").do(self.upload_next_reel)
-        schedule.every().monday.at("17:30").do(self.upload_next_reel)
-        schedule.every().monday.at("21:00").do(self.upload_next_reel)
-        
-        schedule.every().tuesday.at("07:30").do(self.upload_next_reel)
-        schedule.every().tuesday.at("11:00").do(self.upload_next_reel)
-        schedule.every().tuesday.at("13:30").do(self.upload_next_reel)
-        schedule.every().tuesday.at("17:30").do(self.upload_next_reel)
-        schedule.every().tuesday.at("21:00").do(self.upload_next_reel)
-        
-        schedule.every().wednesday.at("07:30").do(self.upload_next_reel)
-        schedule.every().wednesday.at("11:00").do(self.upload_next_reel)
-        schedule.every().wednesday.at("13:30").do(self.upload_next_reel)
-        schedule.every().wednesday.at("17:30").do(self.upload_next_reel)
-        schedule.every().wednesday.at("21:00").do(self.upload_next_reel)
-        
-        schedule.every().thursday.at("07:30").do(self.upload_next_reel)
-        schedule.every().thursday.at("11:00").do(self.upload_next_reel)
-        schedule.every().thursday.at("13:30").do(self.upload_next_reel)
-        schedule.every().thursday.at("17:30").do(self.upload_next_reel)
-        schedule.every().thursday.at("21:00").do(self.upload_next_reel)
-        
-        schedule.every().friday.at("07:30").do(self.upload_next_reel)
-        schedule.every().friday.at("11:00").do(self.upload_next_reel)
-        schedule.every().friday.at("13:30").do(self.upload_next_reel)
-        schedule.every().friday.at("17:30").do(self.upload_next_reel)
-        schedule.every().friday.at("21:00").do(self.upload_next_reel)
+        # Weekdays and weekends each get five upload slots
+        for days, times in UPLOAD_SCHEDULE:
+            for day in days:
+                for at in times:
+                    getattr(schedule.every(), day).at(at).do(self.upload_next_reel)
         
-        # Weekend schedule (Saturday & Sunday)
-        schedule.every().saturday.at("09:00").do(self.upload_next_reel)
-        schedule.every().saturday.at("12:00").do(self.upload_next_reel)
-        schedule.every().saturday.at("15:00").do(self.upload_next_reel)
-        schedule.every().saturday.at("18:30").do(self.upload_next_reel)
-        schedule.every().saturday.at("21:30").do(self.upload_next_reel)
-        
-        schedule.every().sunday.at("09:00").do(self.upload_next_reel)
-        schedule.every().sunday.at("12:00").do(self.upload_next_reel)
-        schedule.every().sunday.at("15:00").do(self.upload_next_reel)
-        schedule.every().sunday.at("18:30").do(self.upload_next_reel)
-        schedule.every().sunday.at("21:30").do(self.upload_next_reel)
-        
-        # Daily preparation at midnight
+        # Daily rollover and preparation at midnight
+        schedule.every().day.at("00:00").do(self.rollover_day)
         schedule.every().day.at("00:01").do(self.process_daily_reels)
         
         logger.info("Schedule setup complete")
@@ -301,16 +666,26 @@ class InstagramReelBot:
         logger.info("Starting Instagram Reel Bot")
         self.setup_schedule()
         
-        # Process reels for today if not already done
-        today = datetime.now().strftime('%Y-%m-%d')
-        daily_reels_file = f"daily_reels_{today}.json"
-        if not os.path.exists(daily_reels_file):
+        # Process reels for today if not already done; an imported daily
+        # reels file counts as done even if all of its reels were uploaded
+        imported_today = os.path.exists(f"daily_reels_{self.today}.json.imported")
+        if not self.has_daily_reels() and not imported_today:
             self.process_daily_reels()
         
-        # Keep the script running
-        while True:
-            schedule.run_pending()
-            time.sleep(60)  # Check every minute
+        # Catch up on any export missed by an unclean shutdown
+        self.export_excel()
+        
+        # Sleep until the next scheduled job instead of polling
+        try:
+            while True:
+                idle = schedule.idle_seconds()
+                if idle is None:
+                    break
+                if idle > 0:
+                    time.sleep(idle)
+                schedule.run_pending()
+        finally:
+            self.export_excel()
 
 if __name__ == "__main__":
     bot = InstagramReelBot()